@@ -1,4 +1,12 @@
 from .gcp_interface import GCPInterface
-from .utils import md5sum, read_yaml, signed2gcs, write_video
+from .utils import (
+    VideoDecoder,
+    blake3sum,
+    crc32c,
+    md5sum,
+    read_yaml,
+    signed2gcs,
+    write_video,
+)
 
 __version__ = "0.1.1"
@@ -1,31 +1,121 @@
+import asyncio
 import base64
-import binascii
 import datetime
 import logging
 import os
+import shutil
 import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-import imageio as iio
+import google_crc32c
 import numpy as np
+import requests
 import yaml
+from google.api_core.exceptions import Forbidden
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 from google.oauth2 import service_account
 
 from .utils import (
-    decode_video,
+    YamlDumper,
+    YamlLoader,
+    crc32c,
+    decode_image,
+    decode_video_array,
     decode_video_gen,
+    encode_image,
     get_bucket_and_path,
     md5sum,
     read_yaml,
     write_video,
 )
 
+# Default number of concurrent transfers of the batch methods. A few tens of
+# workers are enough to saturate the link, more only add contention.
+CONCURRENCY = int(os.environ.get("GCP_IO_CONCURRENCY", 16))
+# Default number of kept-alive HTTP connections to GCS. requests keeps only 10,
+# so concurrent transfers would otherwise open a new connection per request.
+POOL_SIZE = 64
+# Files larger than this are transferred in chunks of CHUNK_SIZE concurrently.
+CHUNKED_THRESHOLD = 64 * 1024 * 1024
+CHUNK_SIZE = 32 * 1024 * 1024
+# Upload arguments supported by chunked uploads, others need a single stream
+CHUNKED_UPLOAD_KWARGS = {"content_type", "timeout", "retry"}
+# Extended attribute that tags local copies with the generation of their blob
+GENERATION_XATTR = "user.gcs_generation"
+
+
+def _is_gcs(file_path: str) -> bool:
+    """Returns True if the path is a GCS path, i.e. it begins with gs://"""
+    return file_path.startswith("gs://")
+
+
+def _generation_tag(blob: storage.Blob, local_file: str) -> bytes:
+    """Returns the tag of a local copy of a blob. The bucket and blob names tell
+    apart objects with the same generation, and the size and modification time
+    local copies that were modified after being tagged."""
+    stat = os.stat(local_file)
+    return (
+        f"gs://{blob.bucket.name}/{blob.name}#{blob.generation}"
+        f":{stat.st_size}:{stat.st_mtime_ns}"
+    ).encode()
+
+
+def _tag_generation(blob: storage.Blob, local_file: str):
+    """Tags a local file as an unmodified copy of the current blob generation."""
+    try:
+        os.setxattr(local_file, GENERATION_XATTR, _generation_tag(blob, local_file))
+    except (AttributeError, OSError):
+        pass  # no xattr support in this platform or filesystem
+
+
+def _has_generation_tag(blob: storage.Blob, local_file: str) -> bool:
+    """Returns True if the local file is tagged as a copy of the blob generation."""
+    try:
+        tag = os.getxattr(local_file, GENERATION_XATTR)
+    except (AttributeError, OSError):
+        return False
+    return tag == _generation_tag(blob, local_file)
+
+
+def _resize_pool(session: requests.Session, pool_size: int):
+    """Sets the number of kept-alive connections of the adapter the session uses
+    for GCS. The adapter is kept, as it may carry the client certificate of
+    mutual TLS, retries or proxies."""
+    adapter = session.get_adapter("https://storage.googleapis.com/")
+    if not isinstance(adapter, requests.adapters.HTTPAdapter):
+        return
+    # proxy managers created from now on read the size from the adapter too
+    adapter._pool_maxsize = pool_size
+    adapter.poolmanager.clear()
+    adapter.init_poolmanager(
+        adapter._pool_connections, pool_size, block=adapter._pool_block
+    )
+
 
 class GCPInterface(object):
-    def __init__(self, client: Optional[Union[str, storage.Client]] = None):
+    def __init__(
+        self,
+        client: Optional[Union[str, storage.Client]] = None,
+        pool_size: int = POOL_SIZE,
+    ):
         """Create a GCP interface with given a GCP client or a path to a GCP key file.
         This class implements the following functions for I/O to GCP storage:
 
@@ -35,6 +125,9 @@ class GCPInterface(object):
                 client or path to a GCP service account file. If not provided it will
                 try to create one from the defaults using the environment variable
                 GOOGLE_APPLICATION_CREDENTIALS. Defaults to None.
+            pool_size (int, optional): Maximum number of kept-alive HTTP connections
+                of the client, it should be at least the number of concurrent
+                transfers. Defaults to 64.
 
         Raises:
             ValueError: Error if client is of unsupported type.
@@ -48,6 +141,10 @@ class GCPInterface(object):
             self.client = client
         else:
             raise ValueError("Invalid client type: {}".format(type(client)))
+        if isinstance(self.client._http, requests.Session):
+            _resize_pool(self.client._http, pool_size)
+        # storage.Bucket objects by name, they are reused across calls
+        self._buckets: Dict[str, storage.Bucket] = {}
 
     def read_yaml(self, file_path: str, **kwargs) -> Dict[str, Any]:
         """
@@ -64,11 +161,51 @@ class GCPInterface(object):
         Example of using **kwargs:
             read_yaml(file_path, start=10, end=50)
         """
-        if "gs://" in file_path:
-            return yaml.safe_load(self.get_bytes(file_path, **kwargs))
+        if _is_gcs(file_path):
+            # libyaml parses the downloaded bytes in place. Streaming them through
+            # blob.open() would add a range request per chunk plus one at the end
+            return yaml.load(self.get_bytes(file_path, **kwargs), Loader=YamlLoader)
         else:
             return read_yaml(file_path)
 
+    def read_yaml_batch(
+        self, file_paths: List[str], max_workers: int = CONCURRENCY, **kwargs
+    ) -> List[Dict[str, Any]]:
+        """
+        Reads several yaml files concurrently, so that many small files don't pay
+        one round trip each.
+
+        Args:
+            file_paths (List[str]): Full paths to the files.
+            max_workers (int, optional): Number of concurrent reads.
+                Defaults to GCP_IO_CONCURRENCY environment variable or 16.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'read_yaml' method.
+
+        Returns:
+            List[Dict[str, Any]]: Dictionaries of file contents, in the same order.
+        """
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(partial(self.read_yaml, **kwargs), file_paths))
+
+    async def aread_yaml(self, file_path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Reads a yaml file without blocking the event loop. Several reads can be
+        awaited concurrently with asyncio.gather.
+
+        Args:
+            file_path (str): Full path to the file.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'read_yaml' method.
+
+        Returns:
+            Dict[str, Any]: Dictionary of file contents.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, partial(self.read_yaml, file_path, **kwargs)
+        )
+
     def write_yaml(self, dst_file: str, data: Dict[str, Any], **kwargs) -> None:
         """
         Writes a yaml file.
@@ -82,16 +219,16 @@ class GCPInterface(object):
         Example of using **kwargs:
             write_yaml(dst_file, data, custom_arg="value")
         """
-        if "gs://" in dst_file:
+        if _is_gcs(dst_file):
             self.upload_data(
                 dst_file,
-                yaml.dump(data, default_flow_style=False),
+                yaml.dump(data, Dumper=YamlDumper, default_flow_style=False),
                 "application/x-yaml",
                 **kwargs,
             )
         else:
             with open(dst_file, "w") as outfile:
-                yaml.dump(data, outfile, default_flow_style=False)
+                yaml.dump(data, outfile, Dumper=YamlDumper, default_flow_style=False)
 
     def gcs2signed(self, gcs_path: str, expiration_mins: int = 15, **kwargs) -> str:
         """Generates a v4 signed URL for downloading a blob.
@@ -108,7 +245,7 @@ class GCPInterface(object):
         url = None
         try:
             bucket, file_path = get_bucket_and_path(gcs_path)
-            bucket = self.client.bucket(bucket)
+            bucket = self._bucket(bucket)
             blob = bucket.blob(file_path)
 
             url = blob.generate_signed_url(
@@ -129,7 +266,7 @@ class GCPInterface(object):
         @param file_path (str) Full path to the file
         @returns (bool) True if file exists
         """
-        if "gs://" in file_path:
+        if _is_gcs(file_path):
             try:
                 return self.blob(file_path).exists()
             except Exception as e:
@@ -139,18 +276,97 @@ class GCPInterface(object):
         else:
             return Path(file_path).exists()
 
+    def files_exist(self, file_paths: List[str]) -> Dict[str, bool]:
+        """Checks if several files exist. GCS files in the same directory are
+        resolved with a single listing request bounded to the range of their
+        names, instead of one request per file. Lone files, or all of them if
+        listing is not allowed, are checked one by one with file_exists.
+
+        Args:
+            file_paths (List[str]): Full paths to the files.
+
+        Returns:
+            Dict[str, bool]: Mapping of each given path to True if it exists.
+        """
+        exists = {}
+        # (bucket name, directory) -> {blob name: full path}
+        gcs_files = defaultdict(dict)
+        for file_path in file_paths:
+            if _is_gcs(file_path):
+                bucket_name, blob_name = get_bucket_and_path(file_path)
+                directory = blob_name.rpartition("/")[0]
+                gcs_files[bucket_name, directory][blob_name] = file_path
+            else:
+                exists[file_path] = Path(file_path).exists()
+
+        for (bucket_name, _), blob_names in gcs_files.items():
+            found = None
+            if len(blob_names) > 1:
+                found = self._list_blob_names(bucket_name, list(blob_names))
+            for blob_name, file_path in blob_names.items():
+                if found is None:
+                    exists[file_path] = self.file_exists(file_path)
+                else:
+                    exists[file_path] = blob_name in found
+
+        return exists
+
+    def _list_blob_names(
+        self, bucket_name: str, blob_names: List[str]
+    ) -> Optional[Set[str]]:
+        """Lists the existing blobs between the first and last of the given names,
+        which must be in the same directory.
+
+        Args:
+            bucket_name (str): Name of the bucket.
+            blob_names (List[str]): Names of the blobs in the bucket.
+
+        Returns:
+            Optional[Set[str]]: Names of the listed blobs, None if the client is
+                not allowed to list the bucket.
+        """
+        first, last = min(blob_names), max(blob_names)
+        try:
+            # the delimiter skips the contents of subdirectories within the range
+            # and the field mask keeps the payload small
+            blobs = self.client.list_blobs(
+                bucket_name,
+                prefix=os.path.commonprefix([first, last]),
+                delimiter="/",
+                start_offset=first,
+                end_offset=last + "\x00",
+                fields="items(name),nextPageToken",
+            )
+            return {blob.name for blob in blobs}
+        except Forbidden:
+            # listing needs storage.objects.list, reading a blob only objects.get
+            return None
+
     def remove_file(self, file_path: str) -> None:
         """Removes a file from GCS or local file system.
 
         Args:
             file_path (str): Full path to file
         """
-        if "gs://" in file_path:
+        if _is_gcs(file_path):
             blob = self.blob(file_path)
             blob.delete()
         else:
             os.remove(file_path)
 
+    def _bucket(self, bucket_name: str) -> storage.Bucket:
+        """Gets a cached GCP storage.Bucket object of given bucket name.
+        This WON'T make an HTTP request.
+
+        @param bucket_name (str) Name of the bucket
+
+        @return storage.Bucket Object of bucket
+        """
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self._buckets[bucket_name] = self.client.bucket(bucket_name)
+        return bucket
+
     def get_blob(self, file_path: str) -> storage.Blob:
         """Gets GCP storage.Blob object of given GCS file.
         This will make an HTTP request. This is useful if you
@@ -162,7 +378,7 @@ class GCPInterface(object):
         """
         bucket_name, file_path = get_bucket_and_path(file_path)
         # get bucket with name
-        bucket = self.client.bucket(bucket_name)
+        bucket = self._bucket(bucket_name)
         # get bucket data as blob
         return bucket.get_blob(file_path)
 
@@ -177,7 +393,7 @@ class GCPInterface(object):
         """
         bucket_name, file_path = get_bucket_and_path(file_path)
         # get bucket with name
-        bucket = self.client.bucket(bucket_name)
+        bucket = self._bucket(bucket_name)
         # get bucket data as blob without an HTTP request
         return bucket.blob(file_path)
 
@@ -186,26 +402,49 @@ class GCPInterface(object):
         @param file (str) Full path to file
         @returns (str) md5sum
         """
-        if "gs://" in file:
-            md5_hash = binascii.hexlify(
-                base64.urlsafe_b64decode(self.get_blob(file).md5_hash)
-            ).decode("utf-8")
+        if _is_gcs(file):
+            md5_hash = base64.b64decode(self.get_blob(file).md5_hash).hex()
         else:
             md5_hash = md5sum(file)
         return md5_hash
 
     def check_md5sum(self, gcs_file: str, local_file: str) -> bool:
-        """! Check if there are differences between a local file and one in GCP
+        """! Check if there are differences between a local file and one in GCP.
+            Despite the name, the crc32c checksums are compared, which GCS keeps
+            for every blob and is much cheaper to compute than md5.
         @param gcs_file (str) Full path to the file in cloud storage.
         @param local_file (str) Full path to the local file.
         """
-        # If file exists, check if it has different hash
-        if os.path.exists(local_file) and self.file_exists(gcs_file):
-            remote_filehash = self.get_md5sum(gcs_file)
-            local_filehash = self.get_md5sum(local_file)
-            if local_filehash == remote_filehash:
-                return True
-        return False
+        if not os.path.exists(local_file):
+            return False
+        return self._matches_local_file(self.get_blob(gcs_file), local_file)
+
+    def _matches_local_file(
+        self, blob: Optional[storage.Blob], local_file: str
+    ) -> bool:
+        """! Check if an already fetched GCP blob has the same contents as a local
+            file, so existence and checksum come from a single metadata request.
+        @param blob (Optional[storage.Blob]) Blob with metadata, None if missing.
+        @param local_file (str) Full path to the local file.
+        @returns (bool) True if both files exist and have the same contents.
+        """
+        # If both files exist, check if they have different checksum
+        if blob is None or not os.path.exists(local_file):
+            return False
+        # an unmodified download of this generation needs no checksum at all
+        if _has_generation_tag(blob, local_file):
+            return True
+        # a size mismatch tells them apart without reading the local file
+        if blob.size != os.path.getsize(local_file):
+            return False
+        if google_crc32c.implementation != "c" and blob.md5_hash:
+            # without its C extension crc32c is far slower than hashlib's md5
+            matches = base64.b64decode(blob.md5_hash).hex() == md5sum(local_file)
+        else:
+            matches = blob.crc32c == crc32c(local_file)
+        if matches:
+            _tag_generation(blob, local_file)
+        return matches
 
     def upload_data(
         self,
@@ -253,12 +492,26 @@ class GCPInterface(object):
             data, content_type=content_type, num_retries=num_retries, **kwargs
         )
 
-    def get_bytes(self, gcs_path: str, **kwargs) -> bytes:
+    def get_bytes(
+        self,
+        gcs_path: str,
+        chunked: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_workers: int = 8,
+        **kwargs,
+    ) -> bytes:
         """
         Gets bytes data from google cloud storage.
 
         Args:
             gcs_path (str): Full path to the bucket file.
+            chunked (bool, optional): If True, files larger than CHUNKED_THRESHOLD
+                are downloaded as concurrent range requests. This costs an extra
+                metadata request to know the size. Defaults to False.
+            chunk_size (int, optional): Size in bytes of the ranges when chunked.
+                Defaults to 32 MiB.
+            chunk_workers (int, optional): Number of threads downloading the
+                ranges when chunked. Defaults to 8.
             **kwargs: Additional keyword arguments to be forwarded to the
                 'download_as_bytes' method of the blob object.
 
@@ -272,44 +525,151 @@ class GCPInterface(object):
             get_bytes(gcs_path, start=10, end=50)
         """
         blob = self.blob(gcs_path)
+        if chunked and "start" not in kwargs and "end" not in kwargs:
+            # fetches size and generation, so all ranges read the same version
+            blob.reload()
+            if blob.size > CHUNKED_THRESHOLD:
+                ranges = [
+                    (start, min(start + chunk_size, blob.size) - 1)
+                    for start in range(0, blob.size, chunk_size)
+                ]
+                with ThreadPoolExecutor(chunk_workers) as executor:
+                    chunks = executor.map(
+                        lambda r: blob.download_as_bytes(
+                            start=r[0], end=r[1], **kwargs
+                        ),
+                        ranges,
+                    )
+                    return b"".join(chunks)
         return blob.download_as_bytes(**kwargs)
 
+    async def aget_bytes(self, gcs_path: str, **kwargs) -> bytes:
+        """
+        Gets bytes data from google cloud storage without blocking the event
+        loop. Several reads can be awaited concurrently with asyncio.gather.
+
+        Args:
+            gcs_path (str): Full path to the bucket file.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'get_bytes' method.
+
+        Returns:
+            bytes: Raw data from the file.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, partial(self.get_bytes, gcs_path, **kwargs)
+        )
+
+    def get_ranges(
+        self,
+        gcs_path: str,
+        ranges: List[Tuple[int, int]],
+        max_workers: int = CONCURRENCY,
+        **kwargs,
+    ) -> List[bytes]:
+        """
+        Gets several byte ranges of a google cloud storage file concurrently.
+
+        Args:
+            gcs_path (str): Full path to the bucket file.
+            ranges (List[Tuple[int, int]]): Pairs of (start, end) byte offsets,
+                both inclusive as in the 'get_bytes' method.
+            max_workers (int, optional): Number of concurrent requests.
+                Defaults to GCP_IO_CONCURRENCY environment variable or 16.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'download_as_bytes' method of the blob object.
+
+        Returns:
+            List[bytes]: Raw data of each range, in the same order.
+
+        Example of using **kwargs:
+            get_ranges(gcs_path, [(0, 9), (100, 199)], timeout=10)
+        """
+        blob = self.blob(gcs_path)
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(
+                executor.map(
+                    lambda r: blob.download_as_bytes(start=r[0], end=r[1], **kwargs),
+                    ranges,
+                )
+            )
+
     def download_file(
-        self, src_file: str, dst_file: str, md5sum_check: bool = True, **kwargs
+        self,
+        src_file: str,
+        dst_file: str,
+        md5sum_check: bool = True,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_workers: int = 8,
+        **kwargs,
     ):
         """
-        Downloads the file from cloud storage to local file.
+        Downloads the file from cloud storage to local file. Files larger than
+        CHUNKED_THRESHOLD are downloaded as concurrent range requests.
 
         Args:
             src_file (str): Full path to the file in cloud storage.
             dst_file (str): Full path to the file to be downloaded.
             md5sum_check (bool): Option to check if the file has changed.
                 Defaults to True.
-            **kwargs: Additional keyword arguments to be forwarded to the 'get_bytes'
-                method of the blob object.
+            chunk_size (int, optional): Size in bytes of the ranges of large
+                files. Defaults to 32 MiB.
+            chunk_workers (int, optional): Number of threads downloading the
+                ranges of large files. Defaults to 8.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'download_to_filename' method of the blob object.
 
         Example of using **kwargs:
             download_file(src_file, dst_file, start=10, end=50)
         """
-        if md5sum_check and self.check_md5sum(src_file, dst_file):
+        blob = self.get_blob(src_file)
+        if md5sum_check and self._matches_local_file(blob, dst_file):
             return None
-        content_bytes = self.get_bytes(src_file, **kwargs)
-        with open(dst_file, "wb") as f:
-            f.write(content_bytes)
+        partial_download = "start" in kwargs or "end" in kwargs
+        if blob is not None and blob.size > CHUNKED_THRESHOLD and not partial_download:
+            transfer_manager.download_chunks_concurrently(
+                blob,
+                dst_file,
+                chunk_size=chunk_size,
+                download_kwargs=kwargs,
+                max_workers=chunk_workers,
+                worker_type=transfer_manager.THREAD,
+            )
+        else:
+            # streams straight to disk instead of holding the whole file in memory
+            (blob or self.blob(src_file)).download_to_filename(dst_file, **kwargs)
+        if blob is not None and not partial_download:
+            # later checks of this copy skip hashing it
+            _tag_generation(blob, dst_file)
         return None
 
     def upload_file(
-        self, local_file: str, gcs_file: str, md5sum_check: bool = True, **kwargs
+        self,
+        local_file: str,
+        gcs_file: str,
+        md5sum_check: bool = True,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_workers: int = 8,
+        **kwargs,
     ):
         """
-        Uploads a local file to google cloud storage.
+        Uploads a local file to google cloud storage. Files larger than
+        CHUNKED_THRESHOLD are split in chunks that are uploaded concurrently.
 
         @param local_file (str): Full path to the local file.
         @param gcs_file (str): Full path to the bucket file.
         @param md5sum_check (bool): Option to check if the file has changed
             before uploading. Defaults to True.
+        @param chunk_size (int): Size in bytes of the chunks of large files.
+            Defaults to 32 MiB.
+        @param chunk_workers (int): Number of threads uploading the chunks of
+            large files. Defaults to 8.
         @param **kwargs: Additional keyword arguments to be forwarded to the
-            'upload_from_filename' method of the blob object.
+            'upload_from_filename' method of the blob object. Large files with
+            other arguments than 'content_type', 'timeout' or 'retry', e.g.
+            preconditions as 'if_generation_match', are uploaded in a single
+            stream, as chunked uploads don't support them.
 
         For example, if the 'upload_from_filename' method accepts a 'content_type'
         argument, you can pass it like this:
@@ -317,53 +677,147 @@ class GCPInterface(object):
         """
         if md5sum_check and self.check_md5sum(gcs_file, local_file):
             return None
-        self.blob(gcs_file).upload_from_filename(local_file, **kwargs)
+        if (
+            os.path.getsize(local_file) > CHUNKED_THRESHOLD
+            and set(kwargs) <= CHUNKED_UPLOAD_KWARGS
+        ):
+            transfer_manager.upload_chunks_concurrently(
+                local_file,
+                self.blob(gcs_file),
+                chunk_size=chunk_size,
+                max_workers=chunk_workers,
+                worker_type=transfer_manager.THREAD,
+                **kwargs,
+            )
+        else:
+            self.blob(gcs_file).upload_from_filename(local_file, **kwargs)
         return None
 
-    def read_video(
-        self, filepath: str, **kwargs
-    ) -> Tuple[List[np.ndarray], Dict[str, Any]]:
+    def download_files(
+        self,
+        pairs: List[Tuple[str, str]],
+        max_workers: int = CONCURRENCY,
+        md5sum_check: bool = True,
+        **kwargs,
+    ):
         """
-        Reads a video from a local file or remote file and returns a list of frames
+        Downloads several files from cloud storage to local files concurrently.
+
+        Args:
+            pairs (List[Tuple[str, str]]): Pairs of (src_file, dst_file) paths.
+            max_workers (int, optional): Number of concurrent downloads.
+                Defaults to GCP_IO_CONCURRENCY environment variable or 16.
+            md5sum_check (bool): Option to check if the files have changed.
+                Defaults to True.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'download_file' method.
+        """
+        with ThreadPoolExecutor(max_workers) as executor:
+            # consume the results so that any error is raised here
+            list(
+                executor.map(
+                    lambda pair: self.download_file(*pair, md5sum_check, **kwargs),
+                    pairs,
+                )
+            )
+
+    def upload_files(
+        self,
+        pairs: List[Tuple[str, str]],
+        max_workers: int = CONCURRENCY,
+        md5sum_check: bool = True,
+        **kwargs,
+    ):
+        """
+        Uploads several local files to google cloud storage concurrently.
+
+        Args:
+            pairs (List[Tuple[str, str]]): Pairs of (local_file, gcs_file) paths.
+            max_workers (int, optional): Number of concurrent uploads.
+                Defaults to GCP_IO_CONCURRENCY environment variable or 16.
+            md5sum_check (bool): Option to check if the files have changed
+                before uploading. Defaults to True.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'upload_file' method.
+        """
+        with ThreadPoolExecutor(max_workers) as executor:
+            # consume the results so that any error is raised here
+            list(
+                executor.map(
+                    lambda pair: self.upload_file(*pair, md5sum_check, **kwargs),
+                    pairs,
+                )
+            )
+
+    @contextmanager
+    def _local_file(self, file_path: str, **kwargs) -> Iterator[str]:
+        """Yields a local path with the contents of the given file. GCS files are
+        streamed to a temporary file, which is removed afterwards.
+
+        Args:
+            file_path (str): Full path to the file.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'download_to_filename' method if the file is on Google Cloud Storage.
+
+        Yields:
+            Iterator[str]: Path to a local file.
+        """
+        if not _is_gcs(file_path):
+            yield file_path
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_file = os.path.join(tmp_dir, Path(file_path).name)
+            self.blob(file_path).download_to_filename(local_file, **kwargs)
+            yield local_file
+
+    def read_video(self, filepath: str, **kwargs) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Reads a video from a local file or remote file and returns an array of frames
         and metadata. It uses imageio and ffmpeg to decode the video.
 
         Args:
             filepath (str): Full path to the video file.
-            **kwargs: Additional keyword arguments to be forwarded to the 'get_bytes'
-                method if the file is on Google Cloud Storage.
+            **kwargs: Additional keyword arguments to be forwarded to the
+                'download_to_filename' method if the file is on Google Cloud Storage.
 
         Returns:
-            Tuple[List[np.ndarray], Dict[str, Any]]: List of frames and metadata.
+            Tuple[np.ndarray, Dict[str, Any]]: Contiguous (N, H, W, 3) array of
+                frames and metadata.
 
         Example of using **kwargs:
             read_video(filepath, start=10, end=50)
         """
-        if "gs://" in filepath:
-            video_bytes = self.get_bytes(filepath, **kwargs)
-        else:
-            video_bytes = open(filepath, "rb").read()
-
-        return decode_video(video_bytes)
+        # ffmpeg reads from a file, so the video is never held in memory as bytes
+        with self._local_file(filepath, **kwargs) as local_file:
+            return decode_video_array(local_file)
 
     def read_video_gen(
-        self, filepath: str
+        self,
+        filepath: str,
+        stride: Optional[int] = None,
+        target_fps: Optional[float] = None,
+        keyframes_only: bool = False,
     ) -> Generator[Tuple[np.ndarray, Dict[str, Any]], None, None]:
         """! Reads a video from a local file or remote file and returns a list of
             frames and metadata. It uses imageio and ffmpeg to decode the video.
         @param filepath (str) Full path to the video file.
+        @param stride (Optional[int]) Keep one frame every 'stride' frames.
+        @param target_fps (Optional[float]) Keep frames at most at this rate.
+        @param keyframes_only (bool) Only decode keyframes.
         @returns (Tuple[List[np.ndarray], Dict[str, Any]]) List of frames and metadata.
         """
-        if "gs://" in filepath:
-            video_bytes = self.get_bytes(filepath)
-        else:
-            video_bytes = open(filepath, "rb").read()
-
-        return decode_video_gen(video_bytes)
+        with self._local_file(filepath) as local_file:
+            yield from decode_video_gen(
+                local_file,
+                stride=stride,
+                target_fps=target_fps,
+                keyframes_only=keyframes_only,
+            )
 
     def write_video(
         self,
         dst_file: Union[str, BytesIO],
-        frames: List[np.ndarray],
+        frames: Iterable[np.ndarray],
         fps: int = 30,
         format: str = "mp4",
         **kwargs,
@@ -371,25 +825,31 @@ class GCPInterface(object):
         """! Writes a video to a local file, remote file or BytesIO object.
         For remote file only GCP storage is supported.
         @param dst_file (Union[str, BytesIO]) Path string or BytesIO object.
-        @param frames (List[np.ndarray]) Video list of frames in RGB.
+        @param frames (Iterable[np.ndarray]) Video frames in RGB, a generator
+            can be used to avoid holding the whole video in memory.
         @param fps (int, optional) Desired FPS. Defaults to 30.
         @param format (str, optional) Format of the video in case dst_file is
             a BytesIO object. Defaults to "mp4".
         """
+        # ffmpeg muxers need a seekable file on disk, so the video is encoded once
+        # to a temporary file which is then streamed to its destination
         if isinstance(dst_file, BytesIO):
             with tempfile.TemporaryDirectory() as tmp_dir:
                 dst_path = os.path.join(tmp_dir, f"video.{format}")
                 write_video(dst_path, frames, fps, **kwargs)
                 with open(dst_path, "rb") as f:
-                    dst_file.write(f.read())
-
-            # return dst_file
-        elif "gs://" in dst_file:
-            video_bytes = BytesIO()
+                    shutil.copyfileobj(f, dst_file)
+        elif _is_gcs(dst_file):
             format = Path(dst_file).suffix[1:]
-            self.write_video(video_bytes, frames, fps, format, **kwargs)
-            self.upload_data(dst_file, video_bytes.getvalue(), f"video/{format}")
-            # self.upload_data(dst_file, video_bytes.getvalue(), "video/mpeg")
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                dst_path = os.path.join(tmp_dir, f"video.{format}")
+                write_video(dst_path, frames, fps, **kwargs)
+                self.upload_file(
+                    dst_path,
+                    dst_file,
+                    md5sum_check=False,
+                    content_type=f"video/{format}",
+                )
         else:
             write_video(dst_file, frames, fps, **kwargs)
 
@@ -402,12 +862,16 @@ class GCPInterface(object):
         ".pgm": "application/octet-stream",
     }
 
-    def read_image(self, src_path: str, **kwargs) -> np.ndarray:
+    def read_image(self, src_path: str, scale: int = 1, **kwargs) -> np.ndarray:
         """
         Reads an image from cloud or local storage and returns the image as a numpy array.
+        The image is decoded with OpenCV if installed, which is faster than imageio.
 
         Args:
             src_path (str): Full path to the image file.
+            scale (int, optional): Downscale factor, one of 1, 2, 4 or 8. Useful for
+                thumbnails, as OpenCV decodes JPEG images directly at the reduced
+                size. Downscaled images are always RGB. Defaults to 1.
             **kwargs: Additional keyword arguments to be forwarded to the
                 'get_bytes' method if the file is on Google Cloud Storage.
 
@@ -417,13 +881,13 @@ class GCPInterface(object):
         Example of using **kwargs:
             read_image(src_path, start=10, end=50)
         """
-        if "gs://" in src_path:
+        if _is_gcs(src_path):
             image_bytes = self.get_bytes(src_path, **kwargs)
         else:
             with open(src_path, "rb") as f:
                 image_bytes = f.read()
 
-        return iio.imread(image_bytes)
+        return decode_image(image_bytes, scale, os.path.splitext(src_path)[1])
 
     def write_image(
         self,
@@ -434,7 +898,8 @@ class GCPInterface(object):
     ):
         """
         Writes the image to the destination file locally or cloud.
-        For the moment only GCP storage is supported.
+        For the moment only GCP storage is supported. The image is encoded
+        with OpenCV if installed, which is faster than imageio.
 
         Args:
             dst_file (str): Full path to the image.
@@ -447,9 +912,9 @@ class GCPInterface(object):
             write_image(dst_file, image, encode_args={"quality": 90}, custom_arg="value")
         """
         ext = Path(dst_file).suffix
-        encoded_bytes = iio.imwrite("<bytes>", image, format=ext, **encode_args)
+        encoded_bytes = encode_image(image, ext, encode_args)
 
-        if "gs://" in dst_file:
+        if _is_gcs(dst_file):
             content_type = self.extension_to_content_type[ext]
             self.upload_data(dst_file, encoded_bytes, content_type, **kwargs)
         else:
@@ -468,12 +933,17 @@ class GCPInterface(object):
             Iterator[str]: List of files/folders in the directory.
         """
         bucket_name, file_path = get_bucket_and_path(src_dir)
+        # only the names are needed, the field mask keeps the payload small
         blobs = self.client.list_blobs(
-            bucket_name, prefix=file_path, delimiter=delimiter
+            bucket_name,
+            prefix=file_path,
+            delimiter=delimiter,
+            fields="items(name),nextPageToken,prefixes",
+            page_size=1000,
         )
 
         for blob in blobs:
-            yield os.path.join("gs://", bucket_name, blob.name)
+            yield f"gs://{bucket_name}/{blob.name}"
 
 
 if __name__ == "__main__":
@@ -1,22 +1,81 @@
+import base64
 import hashlib
-import re
-from functools import partial
-from typing import Any, Dict, Generator, List, Tuple
+import mmap
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import imageio
+import google_crc32c
+import imageio_ffmpeg
 import numpy as np
 import yaml
 
+# Private helpers of imageio-ffmpeg, used to read the metadata of the ffmpeg
+# processes started here. They are not part of its public API, which is why
+# pyproject.toml caps imageio-ffmpeg below the next untested minor release
+from imageio_ffmpeg._parsing import LogCatcher, parse_ffmpeg_header
+
+try:
+    # libyaml bindings, much faster than the pure Python implementation
+    from yaml import CDumper as YamlDumper
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import Dumper as YamlDumper
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    # imageio >= 2.16 deprecates the v2 API at the top level of the package
+    import imageio.v2 as imageio
+except ImportError:
+    import imageio
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional, imageio is used without it
+    cv2 = None
+
+try:
+    import blake3
+except ImportError:  # BLAKE3 is optional, only blake3sum needs it
+    blake3 = None
+
+# Formats encoded with OpenCV when it is installed
+CV2_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tiff", ".pgm"}
+
+# Files larger than this are hashed through a memory map
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+SIGNED_URL_PREFIX = "https://storage.googleapis.com/"
+
 
 def write_video(
     dst_file: str,
-    frames: List[np.ndarray],
+    frames: Iterable[np.ndarray],
     fps: int = 30,
     **kwargs,
 ):
-    """! Writes the provided list of frames (video) to a local video file.
+    """! Writes the provided frames (video) to a local video file.
+        Frames are encoded as they are iterated, so a generator can be used to
+        avoid holding the whole video in memory.
     @param dst_file (str) Full destination video file.
-    @param frames (List[np.ndarray]) List of video frames in RGB.
+    @param frames (Iterable[np.ndarray]) Video frames in RGB, e.g. a list or
+        a generator.
     @param fps (int, optional) Desired FPS of the video. Defaults to 30.
     """
     with imageio.get_writer(dst_file, fps=fps, **kwargs) as writer:
@@ -24,6 +83,104 @@ def write_video(
             writer.append_data(image)
 
 
+def encode_image(
+    image: np.ndarray, ext: str, encode_args: Dict[str, Any] = {}
+) -> bytes:
+    """! Encodes an RGB(A) or gray image to the format of the given extension.
+        It uses OpenCV's native encoders for uint8 images if installed, imageio
+        otherwise.
+    @param image (np.ndarray) Image as numpy array.
+    @param ext (str) Extension of the format, with the leading dot.
+    @param encode_args (Dict[str, Any], optional) Encoding arguments of imageio.
+        With OpenCV only 'quality' for JPEG images is supported, others fall
+        back to imageio.
+    @return bytes Encoded image.
+    """
+    is_jpeg = ext.lower() in (".jpg", ".jpeg")
+    # OpenCV writes other dtypes as is, while imageio converts them to the
+    # range of the format, e.g. float images in [0, 1] to [0, 255]. Its PGM
+    # encoder also only takes gray images
+    if (
+        cv2 is None
+        or image.dtype != np.uint8
+        or ext.lower() not in CV2_EXTENSIONS
+        or (ext.lower() == ".pgm" and image.ndim != 2)
+        or not set(encode_args) <= ({"quality"} if is_jpeg else set())
+    ):
+        return imageio.imwrite("<bytes>", image, format=ext, **encode_args)
+
+    # OpenCV works with BGR(A) channel order
+    if image.ndim == 3 and image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    elif image.ndim == 3 and image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+    params = []
+    if "quality" in encode_args:
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(encode_args["quality"])]
+    success, encoded = cv2.imencode(ext, image, params)
+    if not success:
+        raise ValueError(f"Could not encode image as {ext}")
+    return encoded.tobytes()
+
+
+def decode_image(
+    image_bytes: bytes, scale: int = 1, ext: Optional[str] = None
+) -> np.ndarray:
+    """! Decodes an image from bytes to an RGB(A) or gray numpy array.
+        It uses OpenCV's native decoders if installed, imageio otherwise.
+    @param image_bytes (bytes) Encoded image.
+    @param scale (int, optional) Downscale factor, one of 1, 2, 4 or 8. OpenCV
+        decodes JPEG images directly at the reduced size, which is much cheaper
+        than a full decode. Downscaled images are always RGB. Defaults to 1.
+    @param ext (Optional[str]) Extension of the format, with the leading dot. It
+        lets imageio pick its plugin directly instead of probing every format.
+    @return np.ndarray Image as numpy array.
+    """
+    if scale not in (1, 2, 4, 8):
+        raise ValueError(f"Invalid scale {scale}, it must be one of 1, 2, 4 or 8")
+
+    image = None
+    if cv2 is not None:
+        # the reduced modes apply the EXIF orientation unless told otherwise,
+        # which IMREAD_UNCHANGED and imageio never do
+        flag = {
+            1: cv2.IMREAD_UNCHANGED,
+            2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+            4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+            8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION,
+        }[scale]
+        # None if OpenCV does not support the format
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if image is None:
+        if ext:
+            try:
+                image = imageio.imread(image_bytes, format=ext)
+            except Exception:
+                # unknown extension or the contents have another format, each
+                # plugin fails differently so the format is probed instead
+                pass
+        if image is None:
+            image = imageio.imread(image_bytes)
+        if scale == 1:
+            return image
+        # nearest neighbour downscale to the size OpenCV gives, which rounds up
+        # for JPEG images, scaled while decoding, and down for other formats
+        height, width = image.shape[0] // scale, image.shape[1] // scale
+        image = image[::scale, ::scale]
+        if not image_bytes.startswith(b"\xff\xd8"):
+            image = image[: max(height, 1), : max(width, 1)]
+        if image.ndim == 2:
+            image = np.stack([image] * 3, axis=-1)
+        return np.ascontiguousarray(image[..., :3])
+
+    # OpenCV works with BGR(A) channel order
+    if image.ndim == 3 and image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    elif image.ndim == 3 and image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+    return image
+
+
 def read_yaml(filename: str) -> Dict[str, Any]:
     """!
 
@@ -31,8 +188,9 @@ def read_yaml(filename: str) -> Dict[str, Any]:
 
     @return Dict[str, Any] Dictionary with contents of yaml.
     """
-    with open(filename, "r") as stream:
-        data_loaded = yaml.safe_load(stream)
+    # libyaml consumes the raw bytes, no need to decode them in Python first
+    with open(filename, "rb") as stream:
+        data_loaded = yaml.load(stream, Loader=YamlLoader)
         return data_loaded
 
 
@@ -44,12 +202,62 @@ def md5sum(file_path: str) -> str:
     @return str Md5 hash string
     """
     with open(file_path, mode="rb") as f:
+        if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+            try:
+                # hashing the mapped file avoids copying it through read buffers
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return hashlib.md5(mm).hexdigest()
+            except (ValueError, OverflowError, OSError):
+                pass  # files over 2 GB can't be mapped on 32-bit systems
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            # the whole read and hash loop runs in C without holding the GIL
+            return hashlib.file_digest(f, "md5").hexdigest()
+        # read in 1 MiB chunks into a single reused buffer, not capped to the
+        # file size as procfs files or pipes report 0 despite having contents
         d = hashlib.md5()
-        for buf in iter(partial(f.read, 1024), b""):
-            d.update(buf)
+        buf = bytearray(1024 * 1024)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            d.update(view[:n])
     return d.hexdigest()
 
 
+def blake3sum(file_path: str) -> str:
+    """Returns the BLAKE3 hash of a given LOCAL file. The file is memory mapped
+    and hashed with all the cores, so it is much faster than md5sum for large
+    files, but GCS doesn't report BLAKE3 hashes so it only compares local files.
+    It needs the optional blake3 package.
+
+    @param file_path (str) Full path to file
+
+    @return str BLAKE3 hash string
+    """
+    if blake3 is None:
+        raise ImportError("blake3sum needs the blake3 package: pip install blake3")
+    hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return hasher.update_mmap(file_path).hexdigest()
+
+
+def crc32c(file_path: str) -> str:
+    """Returns the crc32c checksum of a given LOCAL file, base64 encoded
+    as GCS reports it in the blob metadata
+
+    @param file_path (str) Full path to file
+
+    @return str Base64 encoded crc32c checksum
+    """
+    checksum = google_crc32c.Checksum()
+    with open(file_path, mode="rb") as f:
+        for buf in iter(partial(f.read, 1024 * 1024), b""):
+            checksum.update(buf)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
+
+
+# signed URLs are long, so fewer of them are kept
+@lru_cache(maxsize=1024)
 def signed2gcs(signed_url: str) -> str:
     """!
     Converts a signed URL to a GCS path. The signed urls
@@ -57,11 +265,13 @@ def signed2gcs(signed_url: str) -> str:
     @param signed_url string with signed URL
     @return string with GCS path
     """
-    gcs_url = signed_url.replace("https://storage.googleapis.com/", "gs://")
-    gcs_url = gcs_url.split("?")[0]
+    gcs_url, _, _ = signed_url.partition("?")
+    if gcs_url.startswith(SIGNED_URL_PREFIX):
+        gcs_url = "gs://" + gcs_url[len(SIGNED_URL_PREFIX) :]
     return gcs_url
 
 
+@lru_cache(maxsize=4096)
 def get_bucket_and_path(gcs_full_path: str) -> Tuple[str]:
     """Splits a google cloud storage path into bucket_name and the rest
     of the path without the 'gs://' at the beginning
@@ -72,39 +282,289 @@ def get_bucket_and_path(gcs_full_path: str) -> Tuple[str]:
     Returns:
         Tuple[str]: Bucket name and the rest of the path
     """
-    m = re.match(r"(gs://)([^/]+)/(.*)", gcs_full_path)
+    if not gcs_full_path.startswith("gs://"):
+        raise ValueError("path is not valid, it needs to start with 'gs://'")
 
-    if m is None:
+    # a single C-level scan, cheaper than matching a regex on every request
+    bucket, sep, file_path = gcs_full_path[5:].partition("/")
+    if not bucket or not sep:
         raise ValueError("path is not valid, it needs to start with 'gs://'")
 
-    bucket = m.group(2)
-    file_path = m.group(3)
     return bucket, file_path
 
 
-def decode_video(video_bytes: bytes) -> Tuple[List[np.ndarray], Dict[str, Any]]:
+def decode_video(
+    video_bytes: Union[str, bytes]
+) -> Tuple[List[np.ndarray], Dict[str, Any]]:
     """! Decodes video from bytes to numpy array and metadata dict.
         It uses ffmpeg as backend.
-    @param video_bytes (bytes) Video bytes.
+        Deprecated: it holds every decoded frame in memory, prefer
+        decode_video_gen to stream the frames or decode_video_array to get
+        them in a single preallocated array.
+    @param video_bytes (Union[str, bytes]) Video bytes or path to a local video file.
     @return Tuple[List[np.ndarray], Dict[str, Any]] List of frames and metadata.
     """
     frames = []
-    with imageio.get_reader(video_bytes, "ffmpeg") as reader:
-        meta = reader.get_meta_data()
-        for image in reader:
-            frames.append(image)
+    meta = {}
+    for image, meta in decode_video_gen(video_bytes):
+        frames.append(image)
     return frames, meta
 
 
+def _start_ffmpeg(
+    input_args: List[str],
+    output_args: Optional[List[str]] = None,
+    bufsize: int = 1 << 20,
+) -> Tuple[subprocess.Popen, LogCatcher]:
+    """! Starts ffmpeg writing raw RGB frames to its stdout.
+    @param input_args (List[str]) ffmpeg arguments up to and including the input.
+    @param output_args (Optional[List[str]]) Extra ffmpeg output arguments.
+    @param bufsize (int) Size of the pipe buffers. Defaults to 1 MiB.
+    @return Tuple[subprocess.Popen, LogCatcher] ffmpeg process and its stderr reader.
+    """
+    cmd = [imageio_ffmpeg.get_ffmpeg_exe(), *input_args, *(output_args or [])]
+    cmd += ["-pix_fmt", "rgb24", "-vcodec", "rawvideo", "-f", "image2pipe", "-"]
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=bufsize,
+    )
+    return process, LogCatcher(process.stderr)
+
+
+def _wait_ffmpeg_meta(log: LogCatcher) -> Dict[str, Any]:
+    """! Waits for the stream information ffmpeg logs once it probed the input.
+    @param log (LogCatcher) stderr reader of the ffmpeg process.
+    @return Dict[str, Any] Metadata of the decoded stream.
+    """
+    while not log.header and log.is_alive():
+        time.sleep(0.01)
+    if not log.header:
+        raise IOError(f"Could not decode video:\n{log.get_text(0.2)}")
+    return parse_ffmpeg_header(log.header)
+
+
+def _readinto_frame(stdout, frame: np.ndarray) -> bool:
+    """! Reads the next raw frame from ffmpeg straight into a numpy array,
+        without intermediate bytes objects.
+    @param stdout ffmpeg stdout pipe.
+    @param frame (np.ndarray) Contiguous (H, W, 3) uint8 array to fill.
+    @return bool False if the stream ended before the frame.
+    """
+    view = memoryview(frame).cast("B")
+    n_read = 0
+    while n_read < len(view):
+        n = stdout.readinto(view[n_read:])
+        if not n:
+            break
+        n_read += n
+    if n_read and n_read < len(view):
+        raise RuntimeError("End of stream reached before a full frame")
+    return n_read > 0
+
+
+def _stop_ffmpeg(process: subprocess.Popen, log: LogCatcher):
+    if process.poll() is None:
+        process.kill()
+    process.wait()
+    log.stop_me()
+    for pipe in (process.stdin, process.stdout, process.stderr):
+        try:
+            pipe.close()
+        except (BrokenPipeError, OSError):
+            # closing stdin flushes its buffer into the killed process
+            pass
+
+
+@contextmanager
+def _video_file(video_bytes: Union[str, bytes]) -> Iterator[str]:
+    """! Gives a local path for a video, writing video bytes to a temporary file.
+        ffmpeg needs to seek most containers, e.g. mp4 with the index at the end,
+        so they can't be piped.
+    @param video_bytes (Union[str, bytes]) Video bytes or path to a local video file.
+    @return Iterator[str] Path to the local video file.
+    """
+    if not isinstance(video_bytes, bytes):
+        yield video_bytes
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_file = os.path.join(tmp_dir, "video")
+        with open(tmp_file, "wb") as f:
+            f.write(video_bytes)
+        yield tmp_file
+
+
+def decode_video_array(
+    video_bytes: Union[str, bytes], out: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """! Decodes video from bytes to a single (N, H, W, 3) numpy array and metadata
+        dict. Frames are read from the ffmpeg pipe straight into one preallocated
+        array instead of a list of per-frame arrays.
+    @param video_bytes (Union[str, bytes]) Video bytes or path to a local video file.
+    @param out (Optional[np.ndarray]) C-contiguous array to write the frames into.
+        If not given it is allocated counting the frames of the video, which only
+        demuxes it.
+    @return Tuple[np.ndarray, Dict[str, Any]] Array of frames and metadata.
+    """
+    with _video_file(video_bytes) as video_file:
+        return _decode_video_file_array(video_file, out)
+
+
+def _decode_video_file_array(
+    video_file: str, out: Optional[np.ndarray]
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    if out is None:
+        n_frames, _ = imageio_ffmpeg.count_frames_and_secs(video_file)
+    process, log = _start_ffmpeg(["-nostdin", "-i", video_file])
+    try:
+        meta = _wait_ffmpeg_meta(log)
+        width, height = meta["size"]
+        if out is None:
+            out = np.empty((n_frames, height, width, 3), np.uint8)
+        n_frames = 0
+        while n_frames < len(out) and _readinto_frame(process.stdout, out[n_frames]):
+            n_frames += 1
+        if n_frames == len(out):
+            # the container may undercount the frames
+            extra_frames = []
+            frame = np.empty((height, width, 3), np.uint8)
+            while _readinto_frame(process.stdout, frame):
+                extra_frames.append(frame)
+                frame = np.empty_like(frame)
+            if extra_frames:
+                out = np.concatenate([out, np.stack(extra_frames)])
+                n_frames = len(out)
+    finally:
+        _stop_ffmpeg(process, log)
+    meta["nframes"] = n_frames
+    return out[:n_frames], meta
+
+
 def decode_video_gen(
-    video_bytes: bytes,
+    video_bytes: Union[str, bytes],
+    stride: Optional[int] = None,
+    target_fps: Optional[float] = None,
+    keyframes_only: bool = False,
 ) -> Generator[Tuple[np.ndarray, Dict[str, Any]], None, None]:
     """! Decodes video from bytes to numpy array and metadata dict.
-        It uses ffmpeg as backend.
-    @param video_bytes (bytes) Video bytes.
+        It uses ffmpeg as backend. Skipped frames are dropped inside ffmpeg,
+        so they are never converted to RGB nor copied through the pipe.
+    @param video_bytes (Union[str, bytes]) Video bytes or path to a local video file.
+    @param stride (Optional[int]) Keep one frame every 'stride' frames.
+    @param target_fps (Optional[float]) Keep frames at most at this rate, based on
+        their timestamps. It never duplicates frames.
+    @param keyframes_only (bool) Only decode keyframes, the rest of the frames
+        are demuxed but not decoded.
     @return Tuple[List[np.ndarray], Dict[str, Any]] List of frames and metadata.
     """
-    with imageio.get_reader(video_bytes, "ffmpeg") as reader:
-        meta = reader.get_meta_data()
-        for image in reader:
-            yield image, meta
+    if stride is not None and target_fps is not None:
+        raise ValueError("Only one of stride and target_fps can be given")
+    input_params = []
+    output_params = []
+    if keyframes_only:
+        input_params += ["-skip_frame", "nokey"]
+    if stride is not None:
+        output_params += ["-vf", f"select=not(mod(n\\,{int(stride)}))"]
+    elif target_fps is not None:
+        # keep the first frame of each 1 / target_fps slot, the slot index is
+        # nudged up so that timestamp rounding doesn't merge adjacent slots
+        slot = f"floor(t*{target_fps}+0.001)"
+        output_params += ["-vf", f"select=gte({slot}\\,ld(0))*st(0\\,{slot}+1)"]
+    if input_params or output_params:
+        # pass the selected frames through instead of resampling them to the fps
+        output_params += ["-vsync", "0"]
+    with _video_file(video_bytes) as video_file:
+        process, log = _start_ffmpeg(
+            ["-nostdin", *input_params, "-i", video_file], output_params
+        )
+        try:
+            meta = _wait_ffmpeg_meta(log)
+            if stride is not None:
+                meta["fps"] = meta["fps"] / stride
+            elif target_fps is not None:
+                meta["fps"] = min(meta["fps"], target_fps)
+            width, height = meta["size"]
+            while True:
+                frame = np.empty((height, width, 3), np.uint8)
+                if not _readinto_frame(process.stdout, frame):
+                    return
+                yield frame, meta
+        finally:
+            _stop_ffmpeg(process, log)
+
+
+class VideoDecoder(object):
+    def __init__(
+        self, input_params: Optional[List[str]] = None, bufsize: int = 1 << 20
+    ):
+        """! Decodes a stream of video fragments, e.g. 1 second MPEG-TS or MKV
+            segments, with a single ffmpeg process. decode_video spawns a new
+            ffmpeg per call, which dominates the time for small fragments.
+            Fragments are given with 'feed' and frames are read by iterating
+            the decoder, so feed and iterate from different threads or call
+            'close' before iterating. ffmpeg probes the input before the first
+            frame, pass "-probesize" and "-analyzeduration" to lower that
+            latency. Use it as a context manager to make sure ffmpeg is stopped.
+        @param input_params (Optional[List[str]]) Extra ffmpeg input arguments,
+            e.g. ["-f", "mpegts"] if the container can't be probed.
+        @param bufsize (int) Size of the pipe buffers. Defaults to 1 MiB.
+        """
+        self._process, self._log = _start_ffmpeg(
+            [*(input_params or []), "-i", "pipe:0"], bufsize=bufsize
+        )
+        # fragments are written from a thread so that feeding never blocks on
+        # ffmpeg waiting for its decoded frames to be read
+        self._fragments = queue.Queue()
+        self._writer = threading.Thread(target=self._write_fragments, daemon=True)
+        self._writer.start()
+        self.meta = None
+
+    def _write_fragments(self):
+        while True:
+            fragment = self._fragments.get()
+            if fragment is None:
+                break
+            try:
+                self._process.stdin.write(fragment)
+                self._process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                # ffmpeg exited or was stopped, the remaining input is dropped
+                return
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg was stopped with input still buffered
+
+    def feed(self, fragment: bytes):
+        """! Queues a fragment of the video to be decoded.
+        @param fragment (bytes) Next bytes of the video stream.
+        """
+        self._fragments.put(fragment)
+
+    def close(self):
+        """! Signals the end of the video stream, iteration stops after the
+        frames of the fed fragments.
+        """
+        self._fragments.put(None)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        self.meta = _wait_ffmpeg_meta(self._log)
+        width, height = self.meta["size"]
+        while True:
+            frame = np.empty((height, width, 3), np.uint8)
+            if not _readinto_frame(self._process.stdout, frame):
+                return
+            yield frame
+
+    def stop(self):
+        """! Stops ffmpeg, discarding any pending input and frames."""
+        self._fragments.put(None)
+        _stop_ffmpeg(self._process, self._log)
+
+    def __enter__(self) -> "VideoDecoder":
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -37,6 +37,15 @@ class TestFilesMethods(unittest.TestCase):
         os.remove("test_donwload.json")
         assert downloaded_file
 
+    def test_modified_dowload_files(self):
+        gcs_url = "gs://gcp-io-tests/files/test_donwload.json"
+        interface.download_file(gcs_url, "test_donwload.json")
+        with open("test_donwload.json", "r+") as json_downloaded:
+            json_downloaded.write(" ")
+        downloaded_file = interface.check_md5sum(gcs_url, "test_donwload.json")
+        os.remove("test_donwload.json")
+        assert not downloaded_file
+
     def test_upload_files(self):
         gcs_url = "gs://gcp-io-tests/files/test_donwload.json"
         interface.download_file(gcs_url, "test_donwload.json")
@@ -67,3 +76,33 @@ class TestFilesMethods(unittest.TestCase):
         os.remove("test_donwload.json")
         assert uploaded_file
 
+    def test_files_exist(self):
+        gcs_url = "gs://gcp-io-tests/files/test_donwload.json"
+        bad_gcs_url = "gs://gcp-io-tests/files/bad_file.json"
+        exists = interface.files_exist([gcs_url, bad_gcs_url])
+        assert exists[gcs_url]
+        assert not exists[bad_gcs_url]
+
+    def test_download_upload_files(self):
+        gcs_url = "gs://gcp-io-tests/files/test_donwload.json"
+        local_files = ["test_donwload_0.json", "test_donwload_1.json"]
+        interface.download_files([(gcs_url, local_file) for local_file in local_files])
+        downloaded_files = all(os.path.exists(f) for f in local_files)
+        new_gcs_files = [
+            "gs://gcp-io-tests/files/test_donwload_new_0.json",
+            "gs://gcp-io-tests/files/test_donwload_new_1.json",
+        ]
+        interface.upload_files(list(zip(local_files, new_gcs_files)))
+        uploaded_files = all(interface.files_exist(new_gcs_files).values())
+        for local_file, new_gcs_file in zip(local_files, new_gcs_files):
+            os.remove(local_file)
+            interface.remove_file(new_gcs_file)
+        assert downloaded_files
+        assert uploaded_files
+
+    def test_get_ranges(self):
+        gcs_url = "gs://gcp-io-tests/files/test_donwload.json"
+        content = interface.get_bytes(gcs_url)
+        ranges = [(0, 1), (2, len(content) - 1)]
+        chunks = interface.get_ranges(gcs_url, ranges)
+        assert chunks == [content[:2], content[2:]]
@@ -3,6 +3,7 @@ import unittest
 
 import numpy as np
 from gcp_io import GCPInterface
+from PIL import Image
 
 interface = GCPInterface()
 
@@ -44,3 +45,25 @@ class TestImageMethods(unittest.TestCase):
     def test_read_image_rgba_local(self):
         orig_image = np.random.randint(0, 255, (32, 32, 4), dtype=np.uint8)
         self.read_write_test(self.local_image, orig_image)
+
+    def test_read_image_rgb_pgm_local(self):
+        orig_image = np.random.randint(0, 255, (32, 32, 3), dtype=np.uint8)
+        self.read_write_test("test.pgm", orig_image)
+        os.remove("test.pgm")
+
+    def test_read_image_scale_local(self):
+        orig_image = np.random.randint(0, 255, (32, 32, 4), dtype=np.uint8)
+        interface.write_image(self.local_image, orig_image)
+        image = interface.read_image(self.local_image, scale=4)
+        assert image.shape == (8, 8, 3)
+
+    def test_read_image_scale_exif_local(self):
+        orig_image = np.random.randint(0, 255, (40, 80, 3), dtype=np.uint8)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        Image.fromarray(orig_image).save("test.jpg", exif=exif)
+        image = interface.read_image("test.jpg")
+        thumbnail = interface.read_image("test.jpg", scale=2)
+        os.remove("test.jpg")
+        assert image.shape == (40, 80, 3)
+        assert thumbnail.shape == (20, 40, 3)
@@ -3,7 +3,7 @@ import unittest
 from typing import List, Tuple, Union
 
 import numpy as np
-from gcp_io import GCPInterface
+from gcp_io import GCPInterface, VideoDecoder
 
 interface = GCPInterface()
 
@@ -39,6 +39,54 @@ class TestVideoMethods(unittest.TestCase):
         frames = self.get_frames((32, 32, 3), 10)
         self.read_write_test(self.local_video, frames)
 
+    def test_write_video_gen_local(self):
+        frames = self.get_frames((32, 32, 3), 10)
+        interface.write_video(self.local_video, iter(frames), fps=15)
+        video, meta = interface.read_video(self.local_video)
+        assert np.array(frames).shape == np.array(video).shape
+        assert meta["fps"] == 15
+
+    def test_read_video_gen_skip_local(self):
+        frames = self.get_frames((32, 32, 3), 30)
+        interface.write_video(self.local_video, frames, fps=30)
+        strided = list(interface.read_video_gen(self.local_video, stride=3))
+        assert len(strided) == 10
+        assert strided[0][1]["fps"] == 10
+        sampled = list(interface.read_video_gen(self.local_video, target_fps=15))
+        assert len(sampled) == 15
+        assert sampled[0][1]["fps"] == 15
+
+    def test_video_decoder_fragments(self):
+        frames = self.get_frames((32, 32, 3), 10)
+        interface.write_video("test.mkv", frames, fps=15)
+        with open("test.mkv", "rb") as f:
+            data = f.read()
+        os.remove("test.mkv")
+        with VideoDecoder() as decoder:
+            for i in range(0, len(data), 1024):
+                decoder.feed(data[i : i + 1024])
+            decoder.close()
+            video = list(decoder)
+        assert np.array(frames).shape == np.array(video).shape
+        assert decoder.meta["fps"] == 15
+
+    def test_video_decoder_early_exit(self):
+        frames = self.get_frames((32, 32, 3), 10)
+        interface.write_video("test.mkv", frames, fps=15)
+        with open("test.mkv", "rb") as f:
+            data = f.read()
+        os.remove("test.mkv")
+        with VideoDecoder() as decoder:
+            decoder.feed(data)
+            decoder.close()
+            for frame in decoder:
+                break
+        assert frame.shape == (32, 32, 3)
+        # stopping with pending input must not raise either
+        decoder = VideoDecoder()
+        decoder.feed(data)
+        decoder.stop()
+
     def test_gen_video(self):
         video_generator = interface.read_video_gen(
             "gs://gcp-io-tests/video/video_rgb.mp4"
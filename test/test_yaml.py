@@ -33,3 +33,15 @@ class TestYamlMethods(unittest.TestCase):
             "b": 2,
         }
         self.read_write_test(self.local_yaml, simple_dict)
+
+    def test_read_yaml_batch(self):
+        simple_dict = {
+            "a": 1,
+            "b": 2,
+        }
+        gcs_url = "gs://gcp-io-tests/yaml/test_simple.yaml"
+        interface.write_yaml(gcs_url, simple_dict)
+        interface.write_yaml(self.local_yaml, simple_dict)
+        read_dicts = interface.read_yaml_batch([gcs_url, self.local_yaml])
+        for read_dict in read_dicts:
+            self.assertCountEqual(simple_dict, read_dict)